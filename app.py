@@ -1,108 +1,167 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
+import json
 import uuid
 from datetime import datetime
+from financial_store import read_financial, append_financial_event
 
+GALLERY_PAGE_SIZE = 20
+ENRICHED_COLUMNS = [
+    'artwork_id', 'artist_id', 'name', 'title', 'medium', 'creation_year_start',
+    'storage_key', 'thumb_key', 'location_text', 'rights', 'attributes_json',
+    # Financial event id; the enriched frame has one row per artwork event
+    'id',
+]
+ENRICHED_DTYPES = {
+    'artwork_id': 'string',
+    # Arrow-backed so the title search runs in pyarrow's substring kernel
+    'title': 'string[pyarrow]',
+    # Categorical so unique/isin/nunique work on integer codes
+    'artist_id': 'category', 'name': 'category', 'medium': 'category',
+}
+
+@st.cache_data(show_spinner=False)
 def load_data():
     enriched_path = os.path.join('out', 'artworks_enriched.csv')
+    parquet_path = os.path.join('out', 'artworks_enriched.parquet')
     summary_path = os.path.join('out', 'summary_by_artist.csv')
-    financial_path = os.path.join('artwork_financial.csv')
-    df_enriched = pd.read_csv(enriched_path)
+    # Prefer the typed Parquet output from build_art_data when it exists
+    if os.path.exists(parquet_path):
+        df_enriched = pd.read_parquet(parquet_path, columns=ENRICHED_COLUMNS).astype(ENRICHED_DTYPES)
+    else:
+        # Callable usecols tolerates outputs built before thumb_key existed
+        df_enriched = pd.read_csv(enriched_path, usecols=lambda c: c in ENRICHED_COLUMNS, dtype=ENRICHED_DTYPES)
+    if 'thumb_key' in df_enriched.columns:
+        df_enriched['thumb_key'] = df_enriched['thumb_key'].fillna(df_enriched['storage_key'])
+    else:
+        df_enriched['thumb_key'] = df_enriched['storage_key']
+    # The build streams rows in financial-log order, which is effectively random; sort once
+    # here so the gallery lists artworks in a stable order with an artwork's rows together
+    df_enriched = df_enriched.sort_values(['name', 'title', 'artwork_id'], kind='stable', ignore_index=True)
+    # Parse years once here rather than on every filter pass
+    df_enriched['creation_year_start'] = pd.to_numeric(df_enriched['creation_year_start'], errors='coerce', downcast='integer').astype('Int32')
     df_summary = pd.read_csv(summary_path)
-    df_financial = pd.read_csv(financial_path)
+    # Typed Parquet dataset: event_date is already a timestamp, prices already floats
+    df_financial = read_financial()
     return df_enriched, df_summary, df_financial
 
 def add_financial_event(artwork_id, event_type, event_date, currency, price_amount, buyer_name, seller_name, sale_location, source, notes):
-    new_id = str(uuid.uuid4())
-    now = datetime.utcnow().isoformat()
-    new_row = {
-        'id': new_id,
-        'artwork_id': artwork_id,
-        'event_type': event_type,
-        'event_date': event_date,
-        'currency': currency,
-        'price_amount': price_amount,
-        'price_estimate_min': '',
-        'price_estimate_max': '',
-        'buyer_name': buyer_name,
-        'seller_name': seller_name,
-        'sale_location': sale_location,
-        'source': source,
-        'notes': notes,
-        'created_at': now,
-        'updated_at': now
-    }
-    df = pd.read_csv('artwork_financial.csv')
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv('artwork_financial.csv', index=False)
+    now = datetime.utcnow().isoformat(timespec='seconds')
+    # Positional in FINANCIAL_COLUMNS order; the two estimate columns are left empty
+    new_row = (uuid.uuid4().hex, artwork_id, event_type, event_date, currency, price_amount,
+               None, None, buyer_name, seller_name, sale_location, source, notes, now, now)
+    append_financial_event(new_row)
+    # Drop cached frames so the KPIs pick up the new row on the next rerun
+    st.cache_data.clear()
     return new_row
 
+@st.cache_data(show_spinner=False)
+def get_filter_options(df):
+    # Categories are exactly the distinct non-null values of the unfiltered frame
+    artists = tuple(df['name'].cat.categories)
+    mediums = tuple(df['medium'].cat.categories)
+    years = df['creation_year_start']
+    return artists, mediums, int(years.min()), int(years.max())
+
 def sidebar_filters(df):
     st.sidebar.header("Filters")
-    artists = df['name'].unique()
-    mediums = df['medium'].dropna().unique()
-    years = df['creation_year_start'].dropna().astype(int)
-    min_year, max_year = years.min(), years.max()
+    artists, mediums, min_year, max_year = get_filter_options(df)
     selected_artists = st.sidebar.multiselect("Artist", artists, default=list(artists))
     selected_mediums = st.sidebar.multiselect("Medium", mediums, default=list(mediums))
     year_range = st.sidebar.slider("Creation Year Range", min_year, max_year, (min_year, max_year))
     search_text = st.sidebar.text_input("Search Title")
     return selected_artists, selected_mediums, year_range, search_text
 
+def category_mask(col, selected):
+    # Test membership once per category, then gather by integer code; code -1 (NaN) hits the trailing False
+    lookup = np.append(col.cat.categories.isin(selected), False)
+    return lookup[col.cat.codes.to_numpy()]
+
 def filter_data(df, selected_artists, selected_mediums, year_range, search_text):
-    filtered = df[df['name'].isin(selected_artists)]
-    filtered = filtered[filtered['medium'].isin(selected_mediums)]
-    filtered = filtered[(filtered['creation_year_start'].astype(float) >= year_range[0]) & (filtered['creation_year_start'].astype(float) <= year_range[1])]
+    # Build one combined mask so the frame is scanned and copied only once
+    in_years = df['creation_year_start'].between(year_range[0], year_range[1])
+    mask = (category_mask(df['name'], selected_artists)
+            & category_mask(df['medium'], selected_mediums)
+            & in_years.to_numpy(dtype=bool, na_value=False))
     if search_text:
-        filtered = filtered[filtered['title'].str.contains(search_text, case=False, na=False)]
-    return filtered
+        mask &= df['title'].str.contains(search_text, case=False, na=False, regex=False).to_numpy()
+    return df.loc[mask]
+
+@st.cache_data(show_spinner=False)
+def sum_last_valuations(df_financial):
+    # Pick each artwork's latest priced event by hashing on artwork_id instead of sorting the whole log;
+    # unpriced events are dropped first so an artwork keeps its last known price, as groupby().last() did
+    dated = df_financial.dropna(subset=['event_date', 'price_amount'])
+    idx = dated.groupby('artwork_id', sort=False)['event_date'].idxmax()
+    last = pd.to_numeric(dated.loc[idx, 'price_amount'], errors='coerce')
+    return float(last.sum())
 
 def kpi_cards(df, df_financial):
     artworks_count = len(df)
-    artists_count = df['artist_id'].nunique()
+    # Filtered frames keep unused categories, so count the codes actually present
+    codes = df['artist_id'].cat.codes.to_numpy()
+    artists_count = int(np.count_nonzero(np.bincount(codes[codes >= 0])))
     artworks_with_images = df['storage_key'].notna().sum() if 'storage_key' in df.columns else 0
-    # Last valuation per artwork
-    last_valuations = df_financial.sort_values('event_date').groupby('artwork_id')['price_amount'].last().astype(float)
-    sum_last_valuations = last_valuations.sum()
+    total_last_valuations = sum_last_valuations(df_financial)
     st.markdown(f"### KPIs")
     col1, col2, col3, col4 = st.columns(4)
     col1.metric("Artworks", artworks_count)
     col2.metric("Artists", artists_count)
     col3.metric("Artworks w/ Images", artworks_with_images)
-    col4.metric("Sum Last Valuations", f"${sum_last_valuations:,.0f}")
+    col4.metric("Sum Last Valuations", f"${total_last_valuations:,.0f}")
 
 def gallery_cards(df, df_financial):
     st.markdown("### Gallery")
-    for idx, row in df.iterrows():
+    # Render one page of cards per rerun rather than the whole filtered set
+    page_count = max(1, -(-len(df) // GALLERY_PAGE_SIZE))
+    page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    st.caption(f"Page {page} of {page_count} ({len(df)} artworks)")
+    df = df.iloc[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
+    # Narrow the log to this page's artworks, then sort and group once so each card is a dict lookup
+    page_financial = df_financial[df_financial['artwork_id'].isin(df['artwork_id'])]
+    fin_sorted = page_financial.sort_values('event_date')
+    fin_by_art = {k: v for k, v in fin_sorted.groupby('artwork_id', sort=False)}
+    df = df.fillna({'thumb_key': ''})
+    for row in df.itertuples(index=False):
         st.markdown("---")
         cols = st.columns([1,2])
         with cols[0]:
-            if 'storage_key' in row and pd.notna(row['storage_key']):
-                st.image(row['storage_key'], width=200)
+            if row.thumb_key:
+                st.image(row.thumb_key, width=200)
         with cols[1]:
-            st.subheader(row['title'])
-            st.write(f"**Artist:** {row['name']}")
-            st.write(f"**Year:** {row['creation_year_start']}")
-            st.write(f"**Medium:** {row['medium']}")
-            st.write(f"**Location:** {row['location_text']}")
-            st.write(f"**Rights:** {row['rights']}")
-            st.write(f"**Attributes:** {row['attributes_json']}")
+            st.subheader(row.title)
+            st.write(f"**Artist:** {row.name}")
+            st.write(f"**Year:** {row.creation_year_start}")
+            st.write(f"**Medium:** {row.medium}")
+            st.write(f"**Location:** {row.location_text}")
+            st.write(f"**Rights:** {row.rights}")
+            # Expander bodies run on every rerun, so gate the parse behind a toggle instead
+            # Keyed on artwork and event (not position) so the state follows the card across filters
+            if st.toggle("Attributes", key=f"attributes_{row.artwork_id}_{row.id}"):
+                try:
+                    st.json(json.loads(row.attributes_json) if isinstance(row.attributes_json, str) else {})
+                except ValueError:
+                    st.write(row.attributes_json)
             # Last financial event
-            fin = df_financial[df_financial['artwork_id'] == row['artwork_id']]
+            fin = fin_by_art.get(row.artwork_id, df_financial.iloc[:0])
             if not fin.empty:
-                last_event = fin.sort_values('event_date').iloc[-1]
+                last_event = fin.iloc[-1]
                 st.write(f"**Last Event:** {last_event['event_type']} on {last_event['event_date']}")
                 st.write(f"**Last Price:** {last_event['price_amount']} {last_event['currency']}")
             # Expandable table for financial history
-            with st.expander("Financial History"):
-                st.dataframe(fin)
+            with st.expander("Financial History", expanded=False):
+                st.dataframe(fin, width='stretch')
+
+@st.cache_data(show_spinner=False)
+def artwork_ids(df):
+    return tuple(sorted(df['artwork_id'].dropna().unique()))
 
 def financial_event_form(df):
     st.sidebar.header("Add Financial Event")
-    artwork_ids = df['artwork_id'].unique()
-    selected_artwork = st.sidebar.selectbox("Artwork", artwork_ids)
+    selected_artwork = st.sidebar.selectbox("Artwork", artwork_ids(df))
     event_type = st.sidebar.text_input("Event Type")
     event_date = st.sidebar.date_input("Event Date", value=datetime.utcnow()).isoformat()
     currency = st.sidebar.text_input("Currency", value="USD")
@@ -113,7 +172,7 @@ def financial_event_form(df):
     source = st.sidebar.text_input("Source")
     notes = st.sidebar.text_area("Notes")
     if st.sidebar.button("Add Event"):
-        new_row = add_financial_event(selected_artwork, event_type, event_date, currency, price_amount, buyer_name, seller_name, sale_location, source, notes)
+        add_financial_event(selected_artwork, event_type, event_date, currency, price_amount, buyer_name, seller_name, sale_location, source, notes)
         st.sidebar.success(f"Added event for artwork {selected_artwork}")
 
 def main():
@@ -1,6 +1,24 @@
+import io
 import os
+import hashlib
+import shutil
+import tempfile
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+import numpy as np
 import pandas as pd
-from typing import Tuple, Dict, List
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from typing import Tuple, Dict, Iterable, Iterator, List, Optional
+from PIL import Image
+from financial_store import FINANCIAL_SCHEMA, compact_financial, iter_financial, read_financial
+
+THUMB_SIZE = (256, 256)
+# Some catalog masters (~712M pixels) exceed Pillow's default decompression-bomb limit;
+# raise it to fit them while still rejecting anything larger
+Image.MAX_IMAGE_PIXELS = 1_000_000_000
 
 def load_data(data_dir: str = '.') -> Dict[str, pd.DataFrame]:
     files = {
@@ -8,56 +26,155 @@ def load_data(data_dir: str = '.') -> Dict[str, pd.DataFrame]:
         'artwork': 'artwork.csv',
         'image_asset': 'image_asset.csv',
         'user': 'user.csv',
-        'artwork_financial': 'artwork_financial.csv',
     }
-    data = {}
-    for key, fname in files.items():
-        path = os.path.join(data_dir, fname)
-        df = pd.read_csv(path)
+    def read(fname: str) -> pd.DataFrame:
+        return pd.read_csv(os.path.join(data_dir, fname))
+    # Files are independent and the C parser releases the GIL while tokenizing, so read them concurrently
+    with ThreadPoolExecutor(max_workers=len(files) + 1) as ex:
+        # The financial log is the Parquet dataset the app appends to, not a CSV
+        # Only the key is needed for validation; merge_data streams the full rows
+        financial = ex.submit(read_financial, data_dir, ['artwork_id'])
+        data = dict(zip(files, ex.map(read, files.values())))
+        data['artwork_financial'] = financial.result()
+    for key, df in data.items():
         print(f"Loaded {key}: columns={list(df.columns)}")
-        data[key] = df
     return data
 
+def missing_keys(child: pd.Series, parent: pd.Series) -> list:
+    return child[~child.isin(parent)].unique().tolist()
+
 def validate_links(data: Dict[str, pd.DataFrame]) -> List[str]:
     warnings = []
     # artwork.artist_id → artist.artist_id
-    missing_artist = set(data['artwork']['artist_id']) - set(data['artist']['artist_id'])
+    missing_artist = missing_keys(data['artwork']['artist_id'], data['artist']['artist_id'])
     if missing_artist:
         warnings.append(f"artwork.artist_id missing in artist.artist_id: {missing_artist}")
     # image_asset.artwork_id → artwork.artwork_id
-    missing_artwork_img = set(data['image_asset']['artwork_id']) - set(data['artwork']['artwork_id'])
+    missing_artwork_img = missing_keys(data['image_asset']['artwork_id'], data['artwork']['artwork_id'])
     if missing_artwork_img:
         warnings.append(f"image_asset.artwork_id missing in artwork.artwork_id: {missing_artwork_img}")
     # artwork.image_primary_id → image_asset.image_id
-    missing_img_primary = set(data['artwork']['image_primary_id']) - set(data['image_asset']['image_id'])
+    missing_img_primary = missing_keys(data['artwork']['image_primary_id'], data['image_asset']['image_id'])
     if missing_img_primary:
         warnings.append(f"artwork.image_primary_id missing in image_asset.image_id: {missing_img_primary}")
     # artwork_financial.artwork_id → artwork.artwork_id
-    missing_artwork_fin = set(data['artwork_financial']['artwork_id']) - set(data['artwork']['artwork_id'])
+    missing_artwork_fin = missing_keys(data['artwork_financial']['artwork_id'], data['artwork']['artwork_id'])
     if missing_artwork_fin:
         warnings.append(f"artwork_financial.artwork_id missing in artwork.artwork_id: {missing_artwork_fin}")
     return warnings
 
-def merge_data(data: Dict[str, pd.DataFrame]) -> pd.DataFrame:
-    # Merge artwork with artist
-    df = pd.merge(data['artwork'], data['artist'], left_on='artist_id', right_on='artist_id', suffixes=('_artwork', '_artist'))
-    # Merge artwork with image_asset (primary image)
-    df = pd.merge(df, data['image_asset'], left_on='image_primary_id', right_on='image_id', suffixes=('', '_image'))
-    # Merge artwork with financials (may be multiple per artwork)
-    df = pd.merge(df, data['artwork_financial'], left_on='artwork_id', right_on='artwork_id', how='left', suffixes=('', '_financial'))
+def save_thumbnail(src, thumb_path: str) -> None:
+    with Image.open(src) as img:
+        # Let JPEGs decode at reduced scale instead of at full resolution
+        img.draft('RGB', THUMB_SIZE)
+        img.thumbnail(THUMB_SIZE)
+        img.convert('RGB').save(thumb_path, 'JPEG')
+
+@functools.lru_cache(maxsize=None)
+def build_thumbnail(storage_key: str, mtime: Optional[float], thumb_path: str) -> str:
+    # mtime is part of the cache key so an edited local source is re-thumbnailed
+    try:
+        if os.path.exists(storage_key):
+            save_thumbnail(storage_key, thumb_path)
+        else:
+            request = Request(storage_key, headers={'User-Agent': 'build_art_data'})
+            # Spool the download to disk rather than holding the whole master in memory
+            with urlopen(request, timeout=30) as resp, tempfile.TemporaryFile() as tmp:
+                shutil.copyfileobj(resp, tmp)
+                tmp.seek(0)
+                save_thumbnail(tmp, thumb_path)
+        return thumb_path
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"Thumbnail failed for {storage_key}: {e}")
+        return storage_key
+
+def make_thumbnail(storage_key: str, image_id: str, thumb_dir: str) -> str:
+    if not isinstance(storage_key, str) or not storage_key:
+        return storage_key
+    # The source is part of the file name so a changed storage_key gets a fresh thumbnail
+    source_hash = hashlib.sha1(storage_key.encode('utf-8')).hexdigest()[:12]
+    thumb_path = os.path.join(thumb_dir, f'{image_id}_{source_hash}.jpg')
+    mtime = os.path.getmtime(storage_key) if os.path.exists(storage_key) else None
+    # Reuse thumbnails from earlier builds unless the local source is newer
+    if os.path.exists(thumb_path) and (mtime is None or os.path.getmtime(thumb_path) >= mtime):
+        return thumb_path
+    return build_thumbnail(storage_key, mtime, thumb_path)
+
+def enrich_artworks(data: Dict[str, pd.DataFrame], thumb_dir: str = os.path.join('out', 'thumbs')) -> pd.DataFrame:
+    artwork = data['artwork']
+    artist = data['artist'].set_index('artist_id')
+    image = data['image_asset'].set_index('image_id', drop=False)
+    # Keep inner-join semantics: drop artworks without a known artist or primary image
+    df = artwork[artwork['artist_id'].isin(artist.index) & artwork['image_primary_id'].isin(image.index)]
+    df = df.rename(columns={c: f'{c}_artwork' for c in artist.columns if c in artwork.columns})
+    # Enrich artwork with artist (lookup by key instead of a full merge)
+    for col in artist.columns:
+        name = f'{col}_artist' if col in artwork.columns else col
+        df[name] = df['artist_id'].map(artist[col])
+    # Enrich artwork with image_asset (primary image)
+    for col in image.columns:
+        name = f'{col}_image' if col in df.columns else col
+        df[name] = df['image_primary_id'].map(image[col])
+    # Small derivatives for the gallery; falls back to the original when thumbnailing fails
+    os.makedirs(thumb_dir, exist_ok=True)
+    df['thumb_key'] = [make_thumbnail(key, image_id, thumb_dir) for key, image_id in zip(df['storage_key'], df['image_id'])]
     return df
 
-def analyze_data(merged_df: pd.DataFrame) -> pd.DataFrame:
-    # Count artworks per artist
-    count_per_artist = merged_df.groupby('artist_id').size().rename('artwork_count')
-    # Total and average financial values per artist
-    financial = merged_df.groupby('artist_id')['price_amount'].agg(['sum', 'mean']).rename(columns={'sum': 'total_price', 'mean': 'avg_price'})
-    # Merge with artist name
-    artist_names = merged_df.groupby('artist_id')['name'].first()
-    summary = pd.concat([artist_names, count_per_artist, financial], axis=1).reset_index()
-    return summary
+def enriched_schema(artworks: pd.DataFrame) -> pa.Schema:
+    # Fixed up front so every streamed chunk is written with the same column types
+    fields = list(pa.Schema.from_pandas(artworks, preserve_index=False).remove_metadata())
+    for field in FINANCIAL_SCHEMA:
+        if field.name == 'artwork_id':
+            continue
+        fields.append(field.with_name(f'{field.name}_financial') if field.name in artworks.columns else field)
+    return pa.schema(fields)
+
+def merge_data(artworks: pd.DataFrame, financial_chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    # Merge artwork with financials one chunk at a time (may be multiple per artwork)
+    has_financial = np.zeros(len(artworks), dtype=bool)
+    for chunk in financial_chunks:
+        has_financial |= artworks['artwork_id'].isin(chunk['artwork_id']).to_numpy()
+        yield pd.merge(artworks, chunk, on='artwork_id', how='inner', suffixes=('', '_financial'))
+    # Artworks without any financial event, as the old left join kept them
+    empty = FINANCIAL_SCHEMA.empty_table().to_pandas()
+    yield pd.merge(artworks[~has_financial], empty, on='artwork_id', how='left', suffixes=('', '_financial'))
+
+def summarize_chunk(merged_df: pd.DataFrame) -> pd.DataFrame:
+    # Partial per-artist aggregates that can be added up across chunks
+    return merged_df.groupby('artist_id', observed=True).agg(
+        name=('name', 'first'),
+        artwork_count=('artwork_id', 'size'),
+        total_price=('price_amount', 'sum'),
+        priced_count=('price_amount', 'count'),
+    )
+
+def analyze_data(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    summary = pd.concat(partials).groupby(level='artist_id').agg(
+        name=('name', 'first'),
+        artwork_count=('artwork_count', 'sum'),
+        total_price=('total_price', 'sum'),
+        priced_count=('priced_count', 'sum'),
+    )
+    summary['avg_price'] = summary['total_price'] / summary['priced_count']
+    return summary.drop(columns='priced_count').reset_index()
+
+def write_enriched(chunks: Iterable[pd.DataFrame], schema: pa.Schema, csv_path: str, parquet_path: str) -> List[pd.DataFrame]:
+    # Peak memory is one merged chunk; the summary is built from per-chunk partials
+    partials = []
+    with pacsv.CSVWriter(csv_path, schema) as csv_writer, \
+            pq.ParquetWriter(parquet_path, schema, compression='zstd') as parquet_writer:
+        for merged in chunks:
+            table = pa.Table.from_pandas(merged, schema=schema, preserve_index=False)
+            csv_writer.write_table(table)
+            parquet_writer.write_table(table)
+            partials.append(summarize_chunk(merged))
+    return partials
 
 def main():
+    # Fold the app's per-event fragments into one file before reading the log
+    compacted = compact_financial()
+    if compacted:
+        print(f"Compacted {compacted} financial log fragments")
     data = load_data()
     warnings = validate_links(data)
     if warnings:
@@ -66,16 +183,22 @@ def main():
             print("-", w)
     else:
         print("All key relationships validated.")
-    merged_df = merge_data(data)
-    summary_df = analyze_data(merged_df)
     # Output directories
     out_dir = 'out'
     os.makedirs(out_dir, exist_ok=True)
-    merged_df.to_csv(os.path.join(out_dir, 'artworks_enriched.csv'), index=False)
+    artworks = enrich_artworks(data)
+    # Arrow writers for the CSV and the typed Parquet copy the app prefers
+    partials = write_enriched(
+        merge_data(artworks, iter_financial()),
+        enriched_schema(artworks),
+        os.path.join(out_dir, 'artworks_enriched.csv'),
+        os.path.join(out_dir, 'artworks_enriched.parquet'),
+    )
+    summary_df = analyze_data(partials)
     summary_df.to_csv(os.path.join(out_dir, 'summary_by_artist.csv'), index=False)
     print("\nSummary by artist:")
     print(summary_df)
-    print(f"\nSaved enriched data to {os.path.join(out_dir, 'artworks_enriched.csv')}")
+    print(f"\nSaved enriched data to {os.path.join(out_dir, 'artworks_enriched.csv')} and {os.path.join(out_dir, 'artworks_enriched.parquet')}")
     print(f"Saved summary to {os.path.join(out_dir, 'summary_by_artist.csv')}")
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+FINANCIAL_CSV = 'artwork_financial.csv'
+FINANCIAL_DIR = 'artwork_financial'
+# Per-event fragments are merged into one file once there are more than this many
+COMPACT_THRESHOLD = 64
+COMPACT_LOCK = '.compact.lock'
+COMPACT_LOCK_STALE_SECONDS = 600
+FINANCIAL_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('artwork_id', pa.string()),
+    ('event_type', pa.string()),
+    ('event_date', pa.timestamp('ns')),
+    ('currency', pa.string()),
+    ('price_amount', pa.float64()),
+    ('price_estimate_min', pa.float64()),
+    ('price_estimate_max', pa.float64()),
+    ('buyer_name', pa.string()),
+    ('seller_name', pa.string()),
+    ('sale_location', pa.string()),
+    ('source', pa.string()),
+    ('notes', pa.string()),
+    ('created_at', pa.string()),
+    ('updated_at', pa.string()),
+])
+FINANCIAL_COLUMNS = tuple(FINANCIAL_SCHEMA.names)
+
+def to_table(df: pd.DataFrame) -> pa.Table:
+    df = df[list(FINANCIAL_COLUMNS)].copy()
+    for field in FINANCIAL_SCHEMA:
+        if pa.types.is_timestamp(field.type):
+            # The legacy CSV uses M/D/YYYY while the app sends ISO dates
+            df[field.name] = pd.to_datetime(df[field.name], format='mixed', errors='coerce')
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce')
+        else:
+            df[field.name] = df[field.name].astype('string')
+    return pa.Table.from_pandas(df, schema=FINANCIAL_SCHEMA, preserve_index=False)
+
+def ensure_financial_dataset(data_dir: str = '.') -> str:
+    dataset_dir = os.path.join(data_dir, FINANCIAL_DIR)
+    if not os.path.isdir(dataset_dir):
+        # One-time import of the seed CSV as the first fragment. Each caller stages in its own
+        # directory so concurrent first runs (two sessions, or the app and the build) never
+        # clobber each other, and a failed import never leaves an empty dataset behind
+        staging_dir = tempfile.mkdtemp(prefix=f'.{FINANCIAL_DIR}.', dir=data_dir)
+        # mkdtemp creates 0700 and the rename keeps it; give the live dataset the normal
+        # umask-based mode so the app and the build can run as different users
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging_dir, 0o777 & ~umask)
+        try:
+            csv_path = os.path.join(data_dir, FINANCIAL_CSV)
+            if os.path.exists(csv_path):
+                pq.write_table(to_table(pd.read_csv(csv_path)), os.path.join(staging_dir, 'seed.parquet'))
+            try:
+                os.replace(staging_dir, dataset_dir)
+            except OSError:
+                # Another caller finished the import first; keep its dataset
+                if not os.path.isdir(dataset_dir):
+                    raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    return dataset_dir
+
+def fragment_paths(dataset_dir: str) -> List[str]:
+    # Same files a dataset read sees: dot/underscore-prefixed names are staging files
+    return sorted(os.path.join(dataset_dir, name) for name in os.listdir(dataset_dir)
+                  if name.endswith('.parquet') and not name.startswith(('.', '_')))
+
+def read_financial(data_dir: str = '.', columns: Optional[List[str]] = None) -> pd.DataFrame:
+    dataset_dir = ensure_financial_dataset(data_dir)
+    # A concurrent compaction may delete a fragment between listing and reading; retry on that
+    for attempt in range(3):
+        try:
+            return pq.read_table(dataset_dir, columns=columns, schema=FINANCIAL_SCHEMA).to_pandas()
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+
+def iter_financial_tables(paths: List[str], batch_size: int) -> Iterator[pa.Table]:
+    # to_batches never combines files, so small per-event fragments are gathered up to
+    # batch_size rows; the chunk count then follows row count, not file count
+    dataset = ds.dataset(paths, schema=FINANCIAL_SCHEMA, format='parquet')
+    pending, pending_rows = [], 0
+    for batch in dataset.to_batches(batch_size=batch_size):
+        if pending and pending_rows + batch.num_rows > batch_size:
+            yield pa.Table.from_batches(pending, schema=FINANCIAL_SCHEMA)
+            pending, pending_rows = [], 0
+        pending.append(batch)
+        pending_rows += batch.num_rows
+    if pending:
+        yield pa.Table.from_batches(pending, schema=FINANCIAL_SCHEMA)
+
+def iter_financial(data_dir: str = '.', batch_size: int = 200_000) -> Iterator[pd.DataFrame]:
+    # Stream the log in bounded batches instead of materializing every fragment at once
+    paths = fragment_paths(ensure_financial_dataset(data_dir))
+    for table in iter_financial_tables(paths, batch_size):
+        yield table.to_pandas()
+
+def compact_financial(data_dir: str = '.', batch_size: int = 200_000) -> int:
+    # Merge all fragments into one file so reads stop paying one open per event
+    dataset_dir = ensure_financial_dataset(data_dir)
+    lock_path = os.path.join(dataset_dir, COMPACT_LOCK)
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        # Someone else is compacting; clear a lock left behind by a crashed run for next time
+        if time.time() - os.path.getmtime(lock_path) > COMPACT_LOCK_STALE_SECONDS:
+            os.remove(lock_path)
+        return 0
+    try:
+        paths = fragment_paths(dataset_dir)
+        if len(paths) <= 1:
+            return 0
+        name = f'compacted-{uuid.uuid4().hex}.parquet'
+        tmp_path = os.path.join(dataset_dir, f'.{name}.tmp')
+        # Streamed in bounded batches, like the build's merge, rather than read whole
+        with pq.ParquetWriter(tmp_path, FINANCIAL_SCHEMA) as writer:
+            for table in iter_financial_tables(paths, batch_size):
+                writer.write_table(table)
+        os.replace(tmp_path, os.path.join(dataset_dir, name))
+        # Readers between the rename and these removals briefly see duplicate rows
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+    finally:
+        os.remove(lock_path)
+
+def coerce_value(value: object, type_: pa.DataType) -> object:
+    if value is None or value == '':
+        return None
+    if pa.types.is_timestamp(type_):
+        return datetime.fromisoformat(value) if isinstance(value, str) else value
+    if pa.types.is_floating(type_):
+        return float(value)
+    return str(value)
+
+def append_financial_event(values: Tuple, data_dir: str = '.') -> None:
+    # values are in FINANCIAL_COLUMNS order; build the one-row table directly, no DataFrame
+    arrays = [pa.array([coerce_value(v, field.type)], type=field.type) for v, field in zip(values, FINANCIAL_SCHEMA)]
+    # Each event is its own fragment, so appending never touches existing rows. It is written
+    # under a dot-prefixed name (skipped by dataset reads) and renamed once complete, so an
+    # interrupted write cannot leave a truncated fragment that breaks every later read
+    dataset_dir = ensure_financial_dataset(data_dir)
+    path = os.path.join(dataset_dir, f"{values[0]}.parquet")
+    tmp_path = os.path.join(dataset_dir, f".{values[0]}.parquet.tmp")
+    pq.write_table(pa.Table.from_arrays(arrays, schema=FINANCIAL_SCHEMA), tmp_path)
+    os.replace(tmp_path, path)
+    if len(fragment_paths(dataset_dir)) > COMPACT_THRESHOLD:
+        compact_financial(data_dir)